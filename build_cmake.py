@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import dataclasses
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+# usage:
+# Drives a cmake based build of the EE. This is the cmake analogue of
+# build.py, which drives the legacy makefile build via buildtools.py.
+#
+# python3 build_cmake.py --build
+# python3 build_cmake.py --debug --build --install
+# python3 build_cmake.py --build-all-tests --run-all-tests
+#
+# The source directory defaults to src/ee and the object directory to
+# obj/<buildtype> under the directory holding this script.  Use
+# --clean-build to wipe the object directory before configuring.
+
+# The number of processors actually available to this process.  The
+# affinity mask respects cgroup and taskset limits, which matters on
+# containerized CI runners where the raw machine count vastly
+# overstates usable parallelism.
+_NPROC = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+         else (os.cpu_count() or 1)
+
+def thisScriptDir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+def defaultGenerator():
+    # Ninja parses its manifest faster and schedules jobs with less
+    # overhead than make, so prefer it when it is on the path.
+    if shutil.which('ninja'):
+        return 'Ninja'
+    return 'Unix Makefiles'
+
+def makeParser():
+    parser = argparse.ArgumentParser(description='Drive a cmake build of the VoltDB EE.')
+    parser.add_argument('--srcdir',
+                        default=os.path.join(thisScriptDir(), 'src', 'ee'),
+                        help='Root of the EE source tree.')
+    parser.add_argument('--objdir',
+                        default=None,
+                        help='Object directory.  Defaults to obj/<buildtype>.')
+    parser.add_argument('--prefix',
+                        default=None,
+                        help='Installation prefix.  Defaults to <objdir>/install.')
+    parser.add_argument('--generator',
+                        default=defaultGenerator(),
+                        help='CMake generator.  Either Ninja or Unix Makefiles.')
+    parser.add_argument('--debug',
+                        action='store_true',
+                        help='Do a debug build.')
+    parser.add_argument('--release',
+                        action='store_true',
+                        help='Do a release build.  This is the default.')
+    parser.add_argument('--memcheck',
+                        action='store_true',
+                        help='Do a memcheck build.')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Build with profiling enabled.')
+    parser.add_argument('--coverage',
+                        action='store_true',
+                        help='Build with coverage instrumentation.')
+    parser.add_argument('--max-processors',
+                        type=int,
+                        default=-1,
+                        help='Maximum number of parallel build jobs.')
+    parser.add_argument('--max-link-jobs',
+                        type=int,
+                        default=max(1, _NPROC // 4),
+                        help='Maximum number of parallel link jobs when building with Ninja.')
+    parser.add_argument('--clean-build',
+                        action='store_true',
+                        help='Delete the object directory before configuring.')
+    parser.add_argument('--build',
+                        action='store_true',
+                        help='Build the EE jni library.')
+    parser.add_argument('--build-ipc',
+                        action='store_true',
+                        help='Build the EE ipc executable as well.')
+    parser.add_argument('--install',
+                        action='store_true',
+                        help='Install what was built.')
+    parser.add_argument('--build-all-tests',
+                        action='store_true',
+                        help='Build all the EE unit tests.')
+    parser.add_argument('--run-all-tests',
+                        action='store_true',
+                        help='Run all the EE unit tests.')
+    parser.add_argument('--show-test-output',
+                        action='store_true',
+                        help='Show the output of failing tests.')
+    return parser
+
+# One field per parser dest, plus the attributes validateConfig derives.
+# Slots make attribute lookup an offset load and turn a typoed attribute
+# into an AttributeError instead of a silently created new one.
+@dataclasses.dataclass(slots=True)
+class Config:
+    srcdir: str
+    objdir: str
+    prefix: str
+    generator: str
+    debug: bool
+    release: bool
+    memcheck: bool
+    profile: bool
+    coverage: bool
+    max_processors: int
+    max_link_jobs: int
+    clean_build: bool
+    build: bool
+    build_ipc: bool
+    install: bool
+    build_all_tests: bool
+    run_all_tests: bool
+    show_test_output: bool
+    # Derived in validateConfig.
+    buildipc: bool = False
+    installipc: bool = False
+    # Memoized configure argv; see configureCommandString.
+    _cfg_argv: list = dataclasses.field(default=None, repr=False, compare=False)
+
+def cmakeBuildType(config):
+    if config.debug:
+        return 'Debug'
+    if config.memcheck:
+        return 'Memcheck'
+    return 'Release'
+
+def validateConfig(config):
+    exclusiveFlagGroups = [[('--debug', config.debug),
+                            ('--release', config.release),
+                            ('--memcheck', config.memcheck)],
+                           [('--profile', config.profile),
+                            ('--coverage', config.coverage)]]
+    for group in exclusiveFlagGroups:
+        given = [name for name, flag in group if flag]
+        if len(given) > 1:
+            print('build_cmake.py: %s are mutually exclusive; give at most one of %s.'
+                  % (', '.join(given), ', '.join(name for name, flag in group)))
+            sys.exit(1)
+    # Running the tests requires that they be built, installing
+    # requires a build, and so on down the chain.
+    buildAllTests = config.build_all_tests or config.run_all_tests
+    build = config.build or buildAllTests or config.install
+    objdir = config.objdir or os.path.join(thisScriptDir(), 'obj',
+                                           cmakeBuildType(config).lower())
+    prefix = config.prefix or os.path.join(objdir, 'install')
+    return dataclasses.replace(config,
+                               build_all_tests=buildAllTests,
+                               build=build,
+                               buildipc=build and config.build_ipc,
+                               installipc=config.install and config.build_ipc,
+                               objdir=objdir,
+                               prefix=prefix)
+
+def getNumberProcessors(config):
+    if config.max_processors > 0:
+        return min(config.max_processors, _NPROC)
+    return _NPROC
+
+def configureCommandString(config):
+    # The argument list is pure in config; build it once and reuse it
+    # between the fingerprint check and the configure run itself.
+    cached = getattr(config, '_cfg_argv', None)
+    if cached is not None:
+        return cached
+    command = ['cmake',
+               '-DCMAKE_BUILD_TYPE=' + cmakeBuildType(config),
+               '-DCMAKE_INSTALL_PREFIX=' + config.prefix,
+               '-DVOLTDB_USE_COVERAGE=' + ('ON' if config.coverage else 'OFF'),
+               '-DVOLTDB_USE_PROFILING=' + ('ON' if config.profile else 'OFF')]
+    if config.generator == 'Ninja':
+        # The EE link steps (jni shared object, ipc executable and the
+        # gtest binaries) are fat enough that N parallel links can
+        # exhaust RAM, so constrain them to a small Ninja job pool
+        # while compiles still scale to the full processor count.
+        command += ['-DCMAKE_JOB_POOLS=compile=%d;link=%d'
+                    % (getNumberProcessors(config), config.max_link_jobs),
+                    '-DCMAKE_JOB_POOL_COMPILE=compile',
+                    '-DCMAKE_JOB_POOL_LINK=link']
+    command += ['-G', config.generator, '-S', config.srcdir, '-B', config.objdir]
+    config._cfg_argv = command
+    return command
+
+def makeBuilderCall(config):
+    # 'cmake --build' works for any generator, and --parallel honors
+    # generator specific job pool semantics which a bare -j does not.
+    return ['cmake', '--build', config.objdir,
+            '--parallel', '%d' % getNumberProcessors(config)]
+
+def buildTargetGroups(config):
+    # Targets within a group are independent DAG roots and may be
+    # dispatched concurrently; the groups themselves run in pipeline
+    # order.  Each command carries its own --parallel, so the builder
+    # still schedules the actual compile jobs.
+    phases = [[('build', config.build), ('buildipc', config.buildipc)],
+              [('install', config.install), ('installipc', config.installipc)],
+              [('alltests', config.build_all_tests)],
+              [('runalltests', config.run_all_tests)]]
+    groups = []
+    for phase in phases:
+        targets = [name for name, wanted in phase if wanted]
+        if targets:
+            groups.append([makeBuilderCall(config) + ['--target', name]
+                           for name in targets])
+    return groups
+
+def drainOutput(stream):
+    for line in stream:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+def runCommand(command, env=None):
+    # No shell: one fewer process per invocation and no quoting bugs
+    # when srcdir or prefix contain spaces.  A reader thread drains the
+    # child's output as it arrives, so a long build never stalls on a
+    # full pipe while we wait for it to finish.
+    print(' '.join(command))
+    proc = subprocess.Popen(command, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            bufsize=1, universal_newlines=True)
+    reader = threading.Thread(target=drainOutput, args=(proc.stdout,))
+    reader.start()
+    returncode = proc.wait()
+    reader.join()
+    return returncode
+
+def deleteDirectory(dirname):
+    # A release EE object tree holds tens of thousands of .o and .d
+    # files, and a single threaded rmtree dominates --clean-build time.
+    # Unlinks in different subdirectories serialize on different parent
+    # inode locks, so removing the top level subtrees concurrently
+    # scales; small trees are not worth the pool startup.
+    if not os.path.exists(dirname):
+        return
+    entries = list(os.scandir(dirname))
+    subdirs = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+    if len(entries) >= 16 and len(subdirs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, _NPROC)) as pool:
+            list(pool.map(lambda entry: shutil.rmtree(entry.path, ignore_errors=True),
+                          subdirs))
+    shutil.rmtree(dirname, ignore_errors=True)
+
+def ensureObjDir(config):
+    # Every cmake invocation names the object directory explicitly, so
+    # there is no need to chdir into it; the script's working directory
+    # stays untouched, which also keeps concurrent builder dispatch safe.
+    if not os.path.exists(config.objdir):
+        try:
+            os.makedirs(config.objdir)
+        except OSError:
+            print("build_cmake.py: cannot create object directory '%s'" % config.objdir)
+            sys.exit(1)
+
+def doConfigure(config):
+    # Reconfiguring is cheap but not free.  Skip cmake entirely when
+    # the cache exists and the configure arguments have not changed
+    # since the last run, so incremental rebuilds go straight to the
+    # builder.
+    command = configureCommandString(config)
+    cfgHash = hashlib.sha1(' '.join(command).encode()).hexdigest()
+    hashFile = os.path.join(config.objdir, '.cfg_hash')
+    if os.path.exists(os.path.join(config.objdir, 'CMakeCache.txt')):
+        try:
+            with open(hashFile) as f:
+                if f.read().strip() == cfgHash:
+                    return 0
+        except IOError:
+            pass
+    returncode = runCommand(command)
+    if returncode == 0:
+        with open(hashFile, 'w') as f:
+            f.write(cfgHash + '\n')
+    return returncode
+
+def doBuild(config):
+    env = None
+    if config.show_test_output and config.run_all_tests:
+        env = dict(os.environ, CTEST_OUTPUT_ON_FAILURE='1')
+    for group in buildTargetGroups(config):
+        if len(group) == 1:
+            returncodes = [runCommand(group[0], env=env)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(group)) as pool:
+                returncodes = list(pool.map(lambda command: runCommand(command, env=env),
+                                            group))
+        for returncode in returncodes:
+            if returncode != 0:
+                return returncode
+    return 0
+
+def main():
+    parser = makeParser()
+    config = validateConfig(Config(**vars(parser.parse_args())))
+    if config.clean_build:
+        deleteDirectory(config.objdir)
+    ensureObjDir(config)
+    returncode = doConfigure(config)
+    if returncode != 0:
+        sys.exit(returncode)
+    if config.build:
+        returncode = doBuild(config)
+    sys.exit(returncode)
+
+if __name__ == '__main__':
+    main()